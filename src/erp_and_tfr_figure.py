@@ -1,72 +1,57 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-import mne
+
+from sample_data import load_epochs
+from tfr_utils import FREQ_TICKS, compute_power, logratio_diff, robust_vmax
 
 def main():
     os.makedirs("results", exist_ok=True)
 
-    data_path = mne.datasets.sample.data_path(verbose=False)
-    raw_fname = os.path.join(data_path, "MEG", "sample", "sample_audvis_raw.fif")
-    event_fname = os.path.join(data_path, "MEG", "sample", "sample_audvis_raw-eve.fif")
-
-    raw = mne.io.read_raw_fif(raw_fname, preload=True, verbose=False)
-    raw.pick("eeg")
-    raw.filter(0.5, 40.0, verbose=False)
-
-    events = mne.read_events(event_fname)
     event_id = {"Auditory/Left": 1, "Auditory/Right": 2}
-
-    epochs = mne.Epochs(
-        raw, events, event_id=event_id,
-        tmin=-0.2, tmax=0.8,
-        baseline=(-0.2, 0.0),
-        preload=True, verbose=False,
-        reject_by_annotation=True,
-    ).resample(250)
+    epochs = load_epochs(
+        event_id, l_freq=0.5, h_freq=40.0, baseline=(-0.2, 0.0), sfreq=250
+    )
 
     # Use a stable channel if available
     preferred = "EEG 014"
     ch = preferred if preferred in epochs.ch_names else epochs.ch_names[0]
 
     # --- ERP (Evoked) ---
-    epochs_L = epochs["Auditory/Left"][:120]
-    epochs_R = epochs["Auditory/Right"][:120]
-
-    evk_L = epochs_L.average()
-    evk_R = epochs_R.average()
-
-    # Extract channel waveform (Volts -> microvolts)
-    t = evk_L.times
-    yL = evk_L.copy().pick(ch).data[0] * 1e6
-    yR = evk_R.copy().pick(ch).data[0] * 1e6
+    # First 120 trials of each condition, kept together so the TFR runs once
+    codes_all = epochs.events[:, 2]
+    epochs_LR = epochs[np.r_[
+        np.flatnonzero(codes_all == event_id["Auditory/Left"])[:120],
+        np.flatnonzero(codes_all == event_id["Auditory/Right"])[:120],
+    ]]
+    # Condition masks in epochs_LR's trial order, shared by ERP and TFR
+    codes = epochs_LR.events[:, 2]
+    is_L = codes == event_id["Auditory/Left"]
+    is_R = codes == event_id["Auditory/Right"]
+
+    # Channel waveform averaged per condition (Volts -> microvolts), taken from
+    # the single-channel array instead of copying per-condition Epochs
+    x = epochs_LR.get_data(picks=[ch])[:, 0]
+    t = epochs_LR.times
+    yL = x[is_L].mean(axis=0) * 1e6
+    yR = x[is_R].mean(axis=0) * 1e6
 
     # --- TFR Difference (Right - Left), baseline logratio ---
-    freqs = np.linspace(4, 40, 50)
+    freqs = np.logspace(np.log10(4), np.log10(40), 32)
     n_cycles = freqs / 2.0
 
-    tfr_L = epochs_L.compute_tfr(
-        method="morlet", freqs=freqs, n_cycles=n_cycles,
-        return_itc=False, average=True, decim=1
-    )
-    tfr_R = epochs_R.compute_tfr(
-        method="morlet", freqs=freqs, n_cycles=n_cycles,
-        return_itc=False, average=True, decim=1
-    )
+    # one TFR pass over both conditions (chosen channel, streamed in trial
+    # batches), averaged per condition afterwards
+    power, tf_times = compute_power(epochs_LR, ch, freqs, n_cycles, decim=2)
+    pow_L = power[is_L].mean(axis=0)
+    pow_R = power[is_R].mean(axis=0)
 
+    # logratio(R) - logratio(L) in one fused pass
     baseline = (-0.2, 0.0)
-    tfr_L.apply_baseline(baseline=baseline, mode="logratio")
-    tfr_R.apply_baseline(baseline=baseline, mode="logratio")
-
-    # pick channel and compute diff map
-    tfr_L_ch = tfr_L.copy().pick(ch)
-    tfr_R_ch = tfr_R.copy().pick(ch)
-    diff = (tfr_R_ch.data[0] - tfr_L_ch.data[0])  # (freq, time)
-
-    tf_times = tfr_L.times
-    tf_freqs = tfr_L.freqs
+    diff = logratio_diff(pow_R, pow_L, tf_times, baseline)  # (freq, time)
+    tf_freqs = freqs
 
-    vmax = np.nanpercentile(np.abs(diff), 98)
+    vmax = robust_vmax(diff, 0.98)
     vmin = -vmax
 
     # --- Figure layout: ERP (top) + TFR diff (bottom) ---
@@ -83,16 +68,17 @@ def main():
     ax1.set_xlim(t[0], t[-1])
 
     ax2 = fig.add_subplot(2, 1, 2)
-    im = ax2.imshow(
-        diff,
-        origin="lower",
-        aspect="auto",
-        extent=[tf_times[0], tf_times[-1], tf_freqs[0], tf_freqs[-1]],
+    im = ax2.pcolormesh(
+        tf_times, tf_freqs, diff,
+        shading="gouraud",  # smooth without bicubic oversampling
         cmap="RdBu_r",
         vmin=vmin,
         vmax=vmax,
-        interpolation="bicubic",
+        rasterized=True,    # keep the heatmap a raster layer in vector outputs
     )
+    ax2.set_yscale("log")
+    ax2.set_yticks(FREQ_TICKS, labels=[str(f) for f in FREQ_TICKS])
+    ax2.minorticks_off()
     ax2.axvline(0, linewidth=1)
     ax2.set_title("TFR Difference (Right − Left), logratio baseline")
     ax2.set_xlabel("Time (s)")
@@ -103,14 +89,14 @@ def main():
 
     plt.tight_layout()
     out_png = os.path.join("results", "erp_tfr_figure.png")
-    fig.savefig(out_png, dpi=400)
+    fig.savefig(out_png, dpi=150)
     plt.close(fig)
 
     # mini report
     with open(os.path.join("results", "erp_tfr_report.txt"), "w", encoding="utf-8") as f:
         f.write("ERP + TFR figure\n")
         f.write(f"Channel: {ch}\n")
-        f.write(f"Epochs L/R: {len(epochs_L)} / {len(epochs_R)}\n")
+        f.write(f"Epochs L/R: {is_L.sum()} / {is_R.sum()}\n")
         f.write("Outputs: results/erp_tfr_figure.png, results/erp_tfr_report.txt\n")
 
     print("Saved:", out_png)
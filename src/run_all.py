@@ -0,0 +1,10 @@
+import erp_and_tfr_figure
+import tfr_mne_sample
+
+def main():
+    # Both analyses in one process: the sample recording is read once and shared
+    tfr_mne_sample.main()
+    erp_and_tfr_figure.main()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import functools
+import os
+import mne
+
+
+@functools.lru_cache(maxsize=1)
+def _data_path():
+    # Resolve (and verify) the dataset directory once per process
+    return mne.datasets.sample.data_path(verbose=False)
+
+
+@functools.lru_cache(maxsize=1)
+def _load_raw():
+    # Read the sample recording once per process (EEG channels only)
+    data_path = _data_path()
+    raw_fname = os.path.join(data_path, "MEG", "sample", "sample_audvis_raw.fif")
+    raw = mne.io.read_raw_fif(raw_fname, preload=True, verbose=False)
+    raw.pick("eeg")
+    return raw
+
+
+@functools.lru_cache(maxsize=1)
+def _load_events():
+    data_path = _data_path()
+    event_fname = os.path.join(data_path, "MEG", "sample", "sample_audvis_raw-eve.fif")
+    return mne.read_events(event_fname)
+
+
+@functools.lru_cache(maxsize=None)
+def _filtered_raw(l_freq, h_freq):
+    # One filter pass per band, shared by every analysis that asks for it
+    return _load_raw().copy().filter(l_freq, h_freq, verbose=False)
+
+
+def load_epochs(event_id, l_freq, h_freq, baseline, sfreq):
+    # Epochs (-0.2 .. 0.8 s) of the band-passed sample EEG, resampled to sfreq
+    epochs = mne.Epochs(
+        _filtered_raw(l_freq, h_freq), _load_events(), event_id=event_id,
+        tmin=-0.2, tmax=0.8,
+        baseline=baseline,
+        preload=True, verbose=False,
+        reject_by_annotation=True,
+    )
+    return epochs.resample(sfreq)
@@ -0,0 +1,141 @@
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.fft import fft, ifft, next_fast_len
+from mne.time_frequency import morlet
+
+
+# Tick positions (Hz) for log-frequency TFR axes over the 4-40 Hz range
+FREQ_TICKS = [4, 8, 13, 20, 30, 40]
+
+
+@functools.lru_cache(maxsize=1)
+def _torch():
+    # Import torch on the first TFR call, not at module import, and only once per
+    # process. The GPU path is optional; SciPy FFT convolution is the fallback.
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
+
+@functools.lru_cache(maxsize=1)
+def has_cuda():
+    torch = _torch()
+    return torch is not None and torch.cuda.is_available()
+
+
+def morlet_bank(sfreq, freqs, n_cycles, n_times, decim=1):
+    # FFTs of the same Morlet wavelets epochs.compute_tfr(method="morlet") uses.
+    # Wavelets are centred on sample 0 (wrapped), so the first n_times samples
+    # of the circular convolution are the "same"-mode output; no cropping offset.
+    # n_fft is a multiple of decim so the output can be decimated in frequency.
+    # Built in double precision, stored as complex64 for the float32 pipeline.
+    Ws = morlet(sfreq, freqs, n_cycles=n_cycles, zero_mean=True)
+    n_conv = n_times + max(len(W) for W in Ws) - 1
+    n_fft = decim * next_fast_len(-(-n_conv // decim))
+
+    bank = np.zeros((len(Ws), n_fft), dtype=np.complex128)
+    for k, W in enumerate(Ws):
+        half = len(W) // 2
+        bank[k, :len(W) - half] = W[half:]
+        bank[k, n_fft - half:] = W[:half]
+    return fft(bank, axis=-1, workers=-1).astype(np.complex64)
+
+
+def _fold(Y, decim):
+    # Keeping every decim-th sample of ifft(Y) equals the ifft of Y folded into
+    # n_fft / decim bins (scaled by 1 / decim), so the inverse FFT shrinks too.
+    if decim == 1:
+        return Y
+    return Y.reshape(Y.shape[:-1] + (decim, Y.shape[-1] // decim)).sum(-2) / decim
+
+
+def morlet_tfr(data, W_fft, decim=1, workers=-1):
+    # (n_trials, n_channels, n_times) -> power (n_trials, n_channels, n_freqs, n_out)
+    n_out = -(-data.shape[-1] // decim)
+    # scipy.fft along the time axis, threaded over the leading (trial, channel) axes;
+    # float32 input stays single precision (complex64) throughout
+    X_fft = fft(data, n=W_fft.shape[-1], axis=-1, workers=workers)
+
+    power = np.empty(data.shape[:2] + (len(W_fft), n_out), dtype=np.float32)
+    for k, W in enumerate(W_fft):  # one freq at a time keeps the complex buffer small
+        conv = ifft(_fold(X_fft * W, decim), axis=-1, workers=workers)[..., :n_out]
+        power[:, :, k] = conv.real ** 2 + conv.imag ** 2
+    return power
+
+
+def gpu_morlet(data, W_fft, decim=1):
+    # Same convolution as morlet_tfr, batched over (trial, channel, freq) on CUDA
+    torch = _torch()
+    n_out = -(-data.shape[-1] // decim)
+    X = torch.as_tensor(data, dtype=torch.float32, device="cuda")
+    W = torch.as_tensor(W_fft, dtype=torch.complex64, device="cuda")
+
+    X_fft = torch.fft.fft(X, n=W.shape[-1])              # [B, C, N]
+    conv = torch.fft.ifft(_fold(X_fft[:, :, None, :] * W[None, None], decim))
+    power = conv[..., :n_out].abs() ** 2                 # [B, C, F, T]
+    return power.cpu().numpy()
+
+
+def _iter_power(data, W_fft, decim, batch_size, max_workers=4):
+    # Morlet power of batch_size trials at a time: yields (first trial, power).
+    # On the CPU the batches are independent and SciPy/NumPy release the GIL, so
+    # up to max_workers of them run concurrently, one FFT thread each. At most
+    # max_workers batches are in flight, so working memory is max_workers x batch.
+    starts = range(0, len(data), batch_size)
+    if has_cuda():
+        for start in starts:
+            yield start, gpu_morlet(data[start:start + batch_size], W_fft, decim)[:, 0]
+        return
+
+    def run(start):
+        batch = data[start:start + batch_size]
+        return morlet_tfr(batch, W_fft, decim, workers=1)[:, 0]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        pending = deque()
+        for start in starts:
+            pending.append((start, ex.submit(run, start)))
+            if len(pending) == max_workers:
+                first, future = pending.popleft()
+                yield first, future.result()
+        for first, future in pending:
+            yield first, future.result()
+
+
+def compute_power(epochs, ch, freqs, n_cycles, decim=1, batch_size=16):
+    # Single-trial Morlet power of one channel, (n_trials, n_freqs, n_out) float32,
+    # and its times. Trials are streamed in batches into a preallocated array;
+    # with a few batches convolved concurrently, peak working memory is set by
+    # max_workers x batch_size rather than by the trial count.
+    sfreq = epochs.info["sfreq"]
+    data = epochs.get_data(picks=[ch]).astype(np.float32)
+    W_fft = morlet_bank(sfreq, freqs, n_cycles, data.shape[-1], decim)
+    times = epochs.times[::decim]
+
+    power = np.empty((len(data), len(W_fft), len(times)), dtype=np.float32)
+    for start, batch in _iter_power(data, W_fft, decim, batch_size):
+        power[start:start + len(batch)] = batch
+    return power, times
+
+
+def logratio_diff(power_a, power_b, times, baseline):
+    # logratio(a) - logratio(b) as mne.baseline.rescale(mode="logratio") defines
+    # it, fused into log10(a / b) - log10(a_base / b_base): one divide and one
+    # log per pixel instead of two full log-ratio passes
+    bmask = (times >= baseline[0]) & (times <= baseline[1])
+    a_base = power_a[..., bmask].mean(axis=-1, keepdims=True)
+    b_base = power_b[..., bmask].mean(axis=-1, keepdims=True)
+    return np.log10(power_a / power_b) - np.log10(a_base / b_base)
+
+
+def robust_vmax(a, q=0.98):
+    # q-quantile of |a| via O(n) partition instead of a full sort (a is finite)
+    a = np.abs(a).ravel()
+    k = min(int(q * a.size), a.size - 1)
+    return np.partition(a, k)[k]
+